@@ -1192,10 +1192,13 @@ def get_mmrparams(hmu_dir=None):
     if Cnt.get("HMUDIR", None):
         hmu_dir = Path(Cnt["HMUDIR"])
         # check each piece of the hardware components
-        for i in Cnt["HMULIST"]:
-            if not (hmu_dir / i).is_file():
-                hmu_dir = None
-                break
+        # (one directory scan instead of a stat() call per component)
+        try:
+            names = {e.name for e in os.scandir(hmu_dir) if e.is_file()}
+        except OSError:
+            names = set()
+        if not set(Cnt["HMULIST"]).issubset(names):
+            hmu_dir = None
     # prompt for installation path
     if hmu_dir is None:
         Cnt["HMUDIR"] = tls.askdirectory(title="Folder for hardware mu-maps: ", name="HMUDIR")
@@ -1,18 +1,29 @@
 '''
 Voxel-driven scatter modelling for PET data
 '''
+import hashlib
 import logging
+import multiprocessing
 import os
+import sys
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from math import pi
 
 import cuvec as cu
 import nibabel as nib
 import numpy as np
 import scipy.ndimage as ndi
-from scipy.interpolate import interp2d
+from scipy.interpolate import RectBivariateSpline
 from scipy.special import erfc
 
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+from niftypet.ninst.tools import path_resources
+
 from .. import mmr_auxe, mmraux, mmrnorm
 from ..img import mmrimg
 from ..prj import mmrprj, mmrrec, petprj
@@ -28,6 +39,94 @@ def fwhm2sig(fwhm, Cnt):
     return (fwhm / Cnt['SO_VXY']) / (2 * (2 * np.log(2))**.5)
 
 
+if njit is not None:
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _zoom3d_cubic(vol, zso, yso, xso):
+        '''
+        separable cubic (Catmull-Rom) resampling of a 3D volume to the
+        requested output shape, applied one axis at a time.
+        '''
+        zsi, ysi, xsi = vol.shape
+
+        # > resample along axis 0
+        tmp0 = np.empty((zso, ysi, xsi), dtype=np.float32)
+        rz = (zsi-1) / (zso-1) if zso > 1 else 0.
+        for zo in prange(zso):
+            c = zo * rz
+            f = int(c)
+            t = c - f
+            w0 = ((-0.5*t + 1.0) * t - 0.5) * t
+            w1 = (1.5*t - 2.5) * t * t + 1.0
+            w2 = ((-1.5*t + 2.0) * t + 0.5) * t
+            w3 = (0.5*t - 0.5) * t * t
+            i0 = max(f - 1, 0)
+            i1 = min(f, zsi - 1)
+            i2 = min(f + 1, zsi - 1)
+            i3 = min(f + 2, zsi - 1)
+            for j in range(ysi):
+                for i in range(xsi):
+                    tmp0[zo, j, i] = (w0 * vol[i0, j, i] + w1 * vol[i1, j, i] +
+                                      w2 * vol[i2, j, i] + w3 * vol[i3, j, i])
+
+        # > resample along axis 1
+        tmp1 = np.empty((zso, yso, xsi), dtype=np.float32)
+        ry = (ysi-1) / (yso-1) if yso > 1 else 0.
+        for zo in prange(zso):
+            for yo in range(yso):
+                c = yo * ry
+                f = int(c)
+                t = c - f
+                w0 = ((-0.5*t + 1.0) * t - 0.5) * t
+                w1 = (1.5*t - 2.5) * t * t + 1.0
+                w2 = ((-1.5*t + 2.0) * t + 0.5) * t
+                w3 = (0.5*t - 0.5) * t * t
+                i0 = max(f - 1, 0)
+                i1 = min(f, ysi - 1)
+                i2 = min(f + 1, ysi - 1)
+                i3 = min(f + 2, ysi - 1)
+                for i in range(xsi):
+                    tmp1[zo, yo, i] = (w0 * tmp0[zo, i0, i] + w1 * tmp0[zo, i1, i] +
+                                       w2 * tmp0[zo, i2, i] + w3 * tmp0[zo, i3, i])
+
+        # > resample along axis 2
+        out = np.empty((zso, yso, xso), dtype=np.float32)
+        rx = (xsi-1) / (xso-1) if xso > 1 else 0.
+        for zo in prange(zso):
+            for yo in range(yso):
+                for xo in range(xso):
+                    c = xo * rx
+                    f = int(c)
+                    t = c - f
+                    w0 = ((-0.5*t + 1.0) * t - 0.5) * t
+                    w1 = (1.5*t - 2.5) * t * t + 1.0
+                    w2 = ((-1.5*t + 2.0) * t + 0.5) * t
+                    w3 = (0.5*t - 0.5) * t * t
+                    i0 = max(f - 1, 0)
+                    i1 = min(f, xsi - 1)
+                    i2 = min(f + 1, xsi - 1)
+                    i3 = min(f + 2, xsi - 1)
+                    out[zo, yo, xo] = (w0 * tmp1[zo, yo, i0] + w1 * tmp1[zo, yo, i1] +
+                                       w2 * tmp1[zo, yo, i2] + w3 * tmp1[zo, yo, i3])
+
+        return out
+
+
+def _zoom3d(vol, scl):
+    '''
+    cubic zoom of a 3D volume by per-axis scale factors scl;
+    uses the parallel Numba resampler when Numba is installed,
+    otherwise falls back to scipy's n-D spline zoom.
+    '''
+    if njit is None:
+        return ndi.interpolation.zoom(vol, scl, order=3)
+
+    zso = int(round(vol.shape[0] * scl[0]))
+    yso = int(round(vol.shape[1] * scl[1]))
+    xso = int(round(vol.shape[2] * scl[2]))
+    return _zoom3d_cubic(np.ascontiguousarray(vol, dtype=np.float32), zso, yso, xso)
+
+
 # ======================================================================
 # S C A T T E R
 # ----------------------------------------------------------------------
@@ -50,41 +149,27 @@ def get_scrystals(scanner_params):
     # > period of scatter crystals (needed for definition)
     SCRS_T = 7
 
-    # > counter for crystal period, SCRS_T
-    cntr = 0
-
-    # > scatter crystal index
-    iscrs = 0
-
-    # > initialise list of transaxial scatter crystal table
-    scrs = []
-
-    # > transaxial scatter crystal selection for modelling
-    for c in range(Cnt['NCRS']):
-        if (((c+1) % 9) == 0):
-            continue
-        cntr += 1
-        if (cntr == SCRS_T):
-            cntr = 0
-            scrs.append([c, 0.5 * (crs[c, 0] + crs[c, 2]), 0.5 * (crs[c, 1] + crs[c, 3])])
-            iscrs += 1
+    # > transaxial scatter crystal selection for modelling:
+    # > every SCRS_T-th crystal, not counting the gap crystals
+    c = np.arange(Cnt['NCRS'])
+    keep = (c+1) % 9 != 0
+    sel = keep & (np.cumsum(keep) % SCRS_T == 0)
+    cs = c[sel]
 
-    # > convert the scatter crystal table to Numpy array
-    scrs = np.array(scrs, dtype=np.float32)
+    # > scatter crystal table with the crystal index and its centre
+    scrs = np.stack([cs, 0.5 * (crs[cs, 0] + crs[cs, 2]), 0.5 * (crs[cs, 1] + crs[cs, 3])],
+                    axis=1).astype(np.float32)
     # ------------------------------------------------------
 
-    logtxt = ''
-
     sirng = np.int16(Cnt['SIRNG'])
 
     # > axial scatter ring positions in cm
     srng = np.zeros((Cnt['NSRNG'], 2), dtype=np.float32)
-    for ir in range(Cnt['NSRNG']):
-        srng[ir, 0] = float(sirng[ir])
-        srng[ir, 1] = axLUT['rng'][sirng[ir], :].mean()
-        logtxt += '> [{}]: ring_i={}, ring_z={}\n'.format(ir, int(srng[ir, 0]), srng[ir, 1])
+    srng[:, 0] = sirng
+    srng[:, 1] = axLUT['rng'][sirng, :].mean(axis=1)
 
-    log.debug(logtxt)
+    log.debug('\n'.join('> [{}]: ring_i={}, ring_z={}'.format(ir, int(srng[ir, 0]), srng[ir, 1])
+                        for ir in range(Cnt['NSRNG'])))
     return {
         'scrs': scrs, 'srng': srng, 'sirng': sirng, 'NSCRS': scrs.shape[0], 'NSRNG': Cnt['NSRNG']}
 
@@ -135,27 +220,25 @@ def get_knlut(Cnt):
 
     knlut = np.zeros((Cnt['NCOS'], 2), dtype=np.float32)
 
-    for i in range(Cnt['NCOS']):
-        cosups = Cnt['COSUPSMX'] + i*COSSTP
-        alpha = 1 / (2-cosups)
-        KNtmp = ((0.5 * Cnt['R02']) * alpha * alpha * (alpha + 1/alpha - (1 - cosups*cosups)))
-        knlut[i, 0] = KNtmp / (2 * pi * Cnt['R02'] * CRSSavg)
-        knlut[i, 1] = ((1+alpha) / (alpha*alpha) *
-                       (2 * (1+alpha) /
-                        (1 + 2*alpha) - 1 / alpha * np.log(1 + 2*alpha)) + np.log(1 + 2*alpha) /
-                       (2*alpha) - (1 + 3*alpha) / ((1 + 2*alpha) * (1 + 2*alpha))) / CRSSavg
-
-        # Add energy resolution:
-        if Cnt['ER'] > 0:
-            log.info('using energy resolution for scatter simulation, ER = {}'.format(Cnt['ER']))
-            knlut[i, 0] *= .5 * erfc(
-                (Cnt['LLD'] - alpha * Cnt['E511']) / (SIG511 * np.sqrt(2 * alpha)))
-            # knlut[i,0] *= .5*erfc( (Cnt['LLD']-alpha*Cnt['E511'])/(SIG511) );
-
-        # for large angles (small cosups)
-        # when the angle in GPU calculations is greater than COSUPSMX
-        if i == 0:
-            knlut[0, 0] = 0
+    cosups = Cnt['COSUPSMX'] + np.arange(Cnt['NCOS'], dtype=np.float32) * COSSTP
+    alpha = 1 / (2-cosups)
+    KNtmp = ((0.5 * Cnt['R02']) * alpha * alpha * (alpha + 1/alpha - (1 - cosups*cosups)))
+    knlut[:, 0] = KNtmp / (2 * pi * Cnt['R02'] * CRSSavg)
+    knlut[:, 1] = ((1+alpha) / (alpha*alpha) *
+                   (2 * (1+alpha) /
+                    (1 + 2*alpha) - 1 / alpha * np.log(1 + 2*alpha)) + np.log(1 + 2*alpha) /
+                   (2*alpha) - (1 + 3*alpha) / ((1 + 2*alpha) * (1 + 2*alpha))) / CRSSavg
+
+    # Add energy resolution:
+    if Cnt['ER'] > 0:
+        log.info('using energy resolution for scatter simulation, ER = {}'.format(Cnt['ER']))
+        knlut[:, 0] *= .5 * erfc(
+            (Cnt['LLD'] - alpha * Cnt['E511']) / (SIG511 * np.sqrt(2 * alpha)))
+        # knlut[:,0] *= .5*erfc( (Cnt['LLD']-alpha*Cnt['E511'])/(SIG511) );
+
+    # for large angles (small cosups)
+    # when the angle in GPU calculations is greater than COSUPSMX
+    knlut[0, 0] = 0
 
     return knlut
 
@@ -176,12 +259,47 @@ def rd2sni(offseg, r1, r0):
 # -------------------------------------------------------------------------------------------------
 
 
-def get_sctLUT(scanner_params):
+# > in-process cache of the scatter LUTs, keyed by the scanner constants
+_sctLUT_cache = {}
+
+
+def _sctlut_key(Cnt):
+    '''hash of the scanner constants which the scatter LUT depends on.'''
+    return hashlib.sha1(
+        repr((Cnt['NRNG'], Cnt['NCRS'], Cnt['RNG_STRT'], Cnt['RNG_END'], Cnt['NCOS'],
+              Cnt['COSUPSMX'], Cnt['R02'], Cnt['ER'], Cnt['E511'], Cnt['LLD'], Cnt['NSRNG'],
+              tuple(Cnt['SIRNG']))).encode()).hexdigest()
+
+
+def get_sctLUT(scanner_params, debug=False):
 
     # > decompose constants, transaxial and axial LUTs are extracted
     Cnt = scanner_params['Cnt']
     txLUT = scanner_params['txLUT']
 
+    # > the LUT is fully determined by the scanner definition, so reuse a
+    # > previously built one (in memory or on disk) instead of rebuilding
+    # > it for every frame; the caches are bypassed in debug mode
+    key = _sctlut_key(Cnt)
+    if not debug:
+        if key in _sctLUT_cache:
+            return _sctLUT_cache[key]
+
+        fcache = os.path.join(path_resources, 'sctlut_{}.npz'.format(key))
+        if os.path.isfile(fcache):
+            # > a corrupted/truncated cache falls through to a rebuild
+            try:
+                sctLUT = dict(np.load(fcache))
+                sctLUT['NSCRS'] = int(sctLUT['NSCRS'])
+                sctLUT['NSRNG'] = int(sctLUT['NSRNG'])
+            except Exception as exc:
+                log.warning('discarding unreadable scatter LUT cache {}: {}'.format(fcache, exc))
+            else:
+                if 'mich_chck' in sctLUT:
+                    sctLUT['mich_chck'] = list(sctLUT['mich_chck'])
+                _sctLUT_cache[key] = sctLUT
+                return sctLUT
+
     # > get the Klein-Nishina LUT:
     KN = get_knlut(Cnt)
 
@@ -206,90 +324,197 @@ def get_sctLUT(scanner_params):
     sctaxW = np.zeros((Cnt['NRNG']**2, 4), dtype=np.float32)
 
     # -just for local check and display of the interpolation at work
-    mich = np.zeros((Cnt['NRNG'], Cnt['NRNG']), dtype=np.float32)
-    mich2 = np.zeros((Cnt['NRNG'], Cnt['NRNG']), dtype=np.float32)
-
-    J, I = np.meshgrid(irng, irng)                           # NOQA: E741
-    mich[J, I] = np.reshape(np.arange(scrs_def['NSRNG']**2),
-                            (scrs_def['NSRNG'], scrs_def['NSRNG']))
-
-    # plt.figure(64)
-    # plt.imshow(mich, interpolation='none')
-
-    for r1 in range(Cnt['RNG_STRT'], Cnt['RNG_END']):
-        # border up and down
-        bd = next(idx for idx in irng if idx >= r1)
-        bu = next(idx for idx in irng[::-1] if idx <= r1)
-        for r0 in range(Cnt['RNG_STRT'], Cnt['RNG_END']):
-
-            # if (np.abs(r1-r0)>MRD):
-            #     continue
-            # border left and right
-            br = next(idx for idx in irng if idx >= r0)
-            bl = next(idx for idx in irng[::-1] if idx <= r0)
-            # print '(r0,r1)=', r0,r1, '(bl,br,bu,bd)', bl,br,bu,bd
-
-            # span-1 sino index (sni) creation:
-            sni = rd2sni(offseg, r1, r0)
-
-            # see: https://en.wikipedia.org/wiki/Bilinear_interpolation
-            if (br == bl) and (bu != bd):
+    if debug:
+        mich = np.zeros((Cnt['NRNG'], Cnt['NRNG']), dtype=np.float32)
+        mich2 = np.zeros((Cnt['NRNG'], Cnt['NRNG']), dtype=np.float32)
+
+        J, I = np.meshgrid(irng, irng)                       # NOQA: E741
+        mich[J, I] = np.reshape(np.arange(scrs_def['NSRNG']**2),
+                                (scrs_def['NSRNG'], scrs_def['NSRNG']))
+
+        # plt.figure(64)
+        # plt.imshow(mich, interpolation='none')
+
+    # > rings of the reduced (if any) ring range
+    rng = np.arange(Cnt['RNG_STRT'], Cnt['RNG_END'])
+
+    # > nearest scatter ring at or above/below each ring
+    # > (replaces the per-ring generator scans over irng)
+    b_up = irng[np.searchsorted(irng, rng)]
+    b_dn = irng[np.searchsorted(irng, rng, side='right') - 1]
+
+    # > 2D grids of all (r1, r0) ring pairs and their bounding scatter rings:
+    # > up/down borders for r1, right/left borders for r0
+    R1, R0 = rng[:, None], rng[None, :]
+    BD, BU = b_up[:, None], b_dn[:, None]
+    BR, BL = b_up[None, :], b_dn[None, :]
+
+    # span-1 sino index (sni) creation for all ring pairs:
+    SNI = rd2sni(offseg, R1, R0)
+
+    # > guarded denominators of the bilinear weights
+    dv = np.where(BD != BU, BD - BU, 1).astype(np.float32)
+    dh = np.where(BR != BL, BR - BL, 1).astype(np.float32)
+
+    # see: https://en.wikipedia.org/wiki/Bilinear_interpolation
+
+    # > interpolation between scatter rings axially only
+    # > (the vertical/horizontal weights vary along one axis only, so they are
+    # > broadcast to the full (r1, r0) grid before the boolean indexing)
+    m = (BR == BL) & (BU != BD)
+    sctaxR[SNI[m], 0] = rd2sni(offseg, BD, R0)[m]
+    sctaxW[SNI[m], 0] = np.broadcast_to((R1-BU) / dv, SNI.shape)[m]
+    sctaxR[SNI[m], 1] = rd2sni(offseg, BU, R0)[m]
+    sctaxW[SNI[m], 1] = np.broadcast_to((BD-R1) / dv, SNI.shape)[m]
+
+    # > interpolation between scatter rings in the other direction only
+    m = (BU == BD) & (BR != BL)
+    sctaxR[SNI[m], 0] = rd2sni(offseg, R1, BL)[m]
+    sctaxW[SNI[m], 0] = np.broadcast_to((BR-R0) / dh, SNI.shape)[m]
+    sctaxR[SNI[m], 1] = rd2sni(offseg, R1, BR)[m]
+    sctaxW[SNI[m], 1] = np.broadcast_to((R0-BL) / dh, SNI.shape)[m]
+
+    # > ring pairs coinciding with the scatter rings
+    m = (BU == BD) & (BR == BL)
+    sctaxR[SNI[m], 0] = SNI[m]
+    sctaxW[SNI[m], 0] = 1
+
+    # > full bilinear interpolation from the four neighbouring scatter rings
+    m = (BU != BD) & (BR != BL)
+    cf = dv * dh
+    sctaxR[SNI[m], 0] = rd2sni(offseg, BD, BL)[m]
+    sctaxW[SNI[m], 0] = ((BR-R0) * (R1-BU) / cf)[m]
+    sctaxR[SNI[m], 1] = rd2sni(offseg, BD, BR)[m]
+    sctaxW[SNI[m], 1] = ((R0-BL) * (R1-BU) / cf)[m]
+    sctaxR[SNI[m], 2] = rd2sni(offseg, BU, BL)[m]
+    sctaxW[SNI[m], 2] = ((BR-R0) * (BD-R1) / cf)[m]
+    sctaxR[SNI[m], 3] = rd2sni(offseg, BU, BR)[m]
+    sctaxW[SNI[m], 3] = ((R0-BL) * (BD-R1) / cf)[m]
 
-                sctaxR[sni, 0] = rd2sni(offseg, bd, r0)
-                sctaxW[sni, 0] = (r1-bu) / float(bd - bu)
-                sctaxR[sni, 1] = rd2sni(offseg, bu, r0)
-                sctaxW[sni, 1] = (bd-r1) / float(bd - bu)
+    sctLUT = {
+        'sctaxR': sctaxR, 'sctaxW': sctaxW, 'offseg': offseg, 'KN': KN, **scrs_def, **sctlut2d}
+
+    if debug:
+        # > local check of the interpolation, as for the original loop version
+        mich2[Cnt['RNG_STRT']:Cnt['RNG_END'], Cnt['RNG_STRT']:Cnt['RNG_END']] = np.select(
+            [(BU == BD) & (BR == BL), (BR == BL) & (BU != BD), (BU == BD) & (BR != BL)],
+            [
+                mich[R1, R0],
+                mich[BD, R0] * sctaxW[SNI, 0] + mich[BU, R0] * sctaxW[SNI, 1],
+                mich[R1, BL] * sctaxW[SNI, 0] + mich[R1, BR] * sctaxW[SNI, 1],],
+            default=mich[BD, BL] * sctaxW[SNI, 0] + mich[BD, BR] * sctaxW[SNI, 1] +
+            mich[BU, BL] * sctaxW[SNI, 2] + mich[BU, BR] * sctaxW[SNI, 3])
+
+        # plt.figure(65), plt.imshow(mich2, interpolation='none')
+
+        sctLUT['mich_chck'] = [mich, mich2]
+        return sctLUT
+
+    _sctLUT_cache[key] = sctLUT
+    # > save to a sidecar and rename atomically, so an interrupted write
+    # > cannot leave a truncated .npz to be picked up by the next run
+    ftmp = fcache + '.tmp.npz'
+    try:
+        np.savez_compressed(ftmp, **sctLUT)
+        os.replace(ftmp, fcache)
+    except OSError as exc:
+        log.warning('could not cache the scatter LUT to {}: {}'.format(fcache, exc))
 
-                mich2[r1, r0] = mich[bd, r0] * sctaxW[sni, 0] + mich[bu, r0] * sctaxW[sni, 1]
+    return sctLUT
 
-            elif (bu == bd) and (br != bl):
 
-                sctaxR[sni, 0] = rd2sni(offseg, r1, bl)
-                sctaxW[sni, 0] = (br-r0) / float(br - bl)
-                sctaxR[sni, 1] = rd2sni(offseg, r1, br)
-                sctaxW[sni, 1] = (r0-bl) / float(br - bl)
+# ------------------------------------------------------------------------------------------------
+# S C A T T E R    I N T E R P O L A T I O N
+# ------------------------------------------------------------------------------------------------
 
-                mich2[r1, r0] = mich[r1, bl] * sctaxW[sni, 0] + mich[r1, br] * sctaxW[sni, 1]
 
-            elif (bu == bd) and (br == bl):
+# =============================================================================
+# > per-process state of the parallel scatter interpolation workers
+_IBSCT = {}
 
-                mich2[r1, r0] = mich[r1, r0]
-                sctaxR[sni, 0] = rd2sni(offseg, r1, r0)
-                sctaxW[sni, 0] = 1
-                continue
 
-            else:
+# > cache of the geometry-only interpolation LUTs, constant across
+# > frames/subjects of the same scanner
+_intrp_luts = {}
 
-                cf = float(((br-bl) * (bd-bu)))
 
-                sctaxR[sni, 0] = rd2sni(offseg, bd, bl)
-                sctaxW[sni, 0] = (br-r0) * (r1-bu) / cf
-                sctaxR[sni, 1] = rd2sni(offseg, bd, br)
-                sctaxW[sni, 1] = (r0-bl) * (r1-bu) / cf
+def _get_intrp_luts(Cnt, sctLUT):
+    '''
+    get the index LUTs for the transaxial scatter interpolation;
+    they depend only on the crystal-to-sino LUT, so they are cached
+    across vsm invocations.
+    '''
+    key = (Cnt['NCRS'], sctLUT['NSCRS'],
+           hashlib.sha1(np.ascontiguousarray(sctLUT['c2sFw']).tobytes()).hexdigest())
+    if key in _intrp_luts:
+        return _intrp_luts[key]
 
-                sctaxR[sni, 2] = rd2sni(offseg, bu, bl)
-                sctaxW[sni, 2] = (br-r0) * (bd-r1) / cf
-                sctaxR[sni, 3] = rd2sni(offseg, bu, br)
-                sctaxW[sni, 3] = (r0-bl) * (bd-r1) / cf
+    # > advanced indexing matrix for rolling the non-interpolated results
+    jj, ii = np.mgrid[0:sctLUT['NSCRS'], 0:sctLUT['NSCRS']]
+    ii = (ii+jj) % sctLUT['NSCRS']
 
-                mich2[r1, r0] = mich[bd, bl] * sctaxW[sni, 0] + mich[bd, br] * sctaxW[
-                    sni, 1] + mich[bu, bl] * sctaxW[sni, 2] + mich[bu, br] * sctaxW[sni, 3]
+    jjnew, iinew = np.mgrid[0:Cnt['NCRS'], 0:Cnt['NCRS']]
+    iinew = (iinew-jjnew) % Cnt['NCRS']
+
+    # > upper/lower triangle masks and sino indices, invariant across sinograms
+    # > add '1' to include index zero (distinguished from after triangulation)
+    qi_u = np.triu(sctLUT['c2sFw'] + 1) > 0
+    qi_l = np.tril(sctLUT['c2sFw'] + 1) > 0
+
+    # > flat sino indices (each unique within its triangle) and the matching
+    # > source positions in the unrolled interpolation grid
+    sidx = np.concatenate([sctLUT['c2sFw'][qi_u], sctLUT['c2sFw'][qi_l]]).astype(np.intp)
+    pos = np.concatenate([np.flatnonzero(qi_u), np.flatnonzero(qi_l)])
+
+    # > direct source coordinates in the interpolated grid for each used
+    # > sino entry, making the full-grid unroll unnecessary
+    row_idx = jjnew.ravel()[pos]
+    col_idx = iinew.ravel()[pos]
+
+    # > only crystal rows with at least one live LOR need interpolating;
+    # > gap-crystal rows would be discarded by the triangle masks anyway
+    rows_ng = np.flatnonzero((sctLUT['c2sFw'] >= 0).any(axis=1))
+    row_map = np.zeros(Cnt['NCRS'], dtype=np.intp)
+    row_map[rows_ng] = np.arange(rows_ng.size)
+    row_sel = row_map[row_idx]
+
+    luts = {
+        'jj': jj, 'ii': ii, 'xnew': np.arange(Cnt['NCRS']), 'rows_ng': rows_ng,
+        'row_sel': row_sel, 'col_idx': col_idx, 'sidx': sidx}
+    _intrp_luts[key] = luts
+    return luts
+
+
+def _init_intrp_worker(x, y, xnew, ynew, row_sel, col_idx, sidx, sn_shape, dtype):
+    '''
+    set up the state shared by all per-sinogram interpolations
+    (called once per worker process).
+    '''
+    _IBSCT.update(x=x, y=y, xnew=xnew, ynew=ynew, row_sel=row_sel, col_idx=col_idx, sidx=sidx,
+                  sn_shape=sn_shape, dtype=dtype)
 
-    # plt.figure(65), plt.imshow(mich2, interpolation='none')
 
-    sctLUT = {
-        'sctaxR': sctaxR, 'sctaxW': sctaxW, 'offseg': offseg, 'KN': KN, 'mich_chck': [mich, mich2],
-        **scrs_def, **sctlut2d}
+def _intrp_sino(sct2d):
+    '''
+    interpolate a single basic (rolled) scatter sinogram into full size.
+    '''
+    w = _IBSCT
 
-    return sctLUT
+    z = np.vstack([sct2d[-1, :], sct2d])
+    f = RectBivariateSpline(w['y'], w['x'], z, kx=3, ky=3)
+    # > evaluate the non-gap crystal rows only; scatter sinograms do not
+    # > need FP64, so drop to FP32 straight away to halve the bandwidth
+    # > of the gather below
+    znew = f(w['ynew'], w['xnew']).astype(np.float32)
 
+    # > gather the used grid points (implicit unroll) and scatter-reduce
+    # > both triangles into the 2D sinogram in one bincount
+    sn2d = np.bincount(w['sidx'], weights=znew[w['row_sel'], w['col_idx']],
+                       minlength=w['sn_shape'][0] * w['sn_shape'][1])
 
-# ------------------------------------------------------------------------------------------------
-# S C A T T E R    I N T E R P O L A T I O N
-# ------------------------------------------------------------------------------------------------
+    return sn2d.astype(w['dtype']).reshape(w['sn_shape'])
 
 
-# =============================================================================
 def intrp_bsct(sct3d, Cnt, sctLUT, ssrlut, dtype=np.float32):
     '''
     interpolate the basic scatter distributions which are then
@@ -308,54 +533,37 @@ def intrp_bsct(sct3d, Cnt, sctLUT, ssrlut, dtype=np.float32):
 
     x = i_scrs
     y = np.append([-1], i_scrs)
-    xnew = np.arange(Cnt['NCRS'])
-    ynew = np.arange(Cnt['NCRS'])
 
-    # > advanced indexing matrix for rolling the non-interpolated results
-    jj, ii = np.mgrid[0:sctLUT['NSCRS'], 0:sctLUT['NSCRS']]
-
-    # > roll each row according to the position
-    for i in range(sctLUT['NSCRS']):
-        ii[i, :] = np.roll(ii[i, :], -1 * i)
+    # > index LUTs for rolling/unrolling and the triangle scatter-reduce
+    luts = _get_intrp_luts(Cnt, sctLUT)
 
-    jjnew, iinew = np.mgrid[0:Cnt['NCRS'], 0:Cnt['NCRS']]
-    for i in range(Cnt['NCRS']):
-        iinew[i, :] = np.roll(iinew[i, :], i)
+    # > roll all basic sinograms in one advanced-indexing gather, giving a
+    # > contiguous (snno, NSCRS, NSCRS) block with unit-stride slices
+    sct_rolled = sct3d[0, :snno][:, luts['jj'], luts['ii']]
 
-    ssn = np.zeros((Cnt['TOFBINN'], snno, Cnt['NSANGLES'], Cnt['NSBINS']), dtype=dtype)
+    # > every ssn sinogram is overwritten below, so skip the zero-fill pass
+    # > over the largest allocation; sssr is accumulated into, hence zeroed
+    ssn = np.empty((Cnt['TOFBINN'], snno, Cnt['NSANGLES'], Cnt['NSBINS']), dtype=dtype)
     sssr = np.zeros((Cnt['TOFBINN'], Cnt['NSEG0'], Cnt['NSANGLES'], Cnt['NSBINS']), dtype=dtype)
 
-    for ti in range(Cnt['TOFBINN']):
-        sn2d = np.zeros(Cnt['NSANGLES'] * Cnt['NSBINS'], dtype=dtype)
-
-        for si in range(snno):
-
-            sn2d[:] = 0
-
-            sct2d = sct3d[0, si, jj, ii]
-
-            z = np.vstack([sct2d[-1, :], sct2d])
-            f = interp2d(x, y, z, kind='cubic')
-            znew = f(xnew, ynew)
-
-            # unroll
-            znew = znew[jjnew, iinew]
-
-            # > upper triangle
-            # > add '1' to include index zero (distinguished from after triangulation)
-            qi = np.triu(sctLUT['c2sFw'] + 1) > 0
-            sidx = sctLUT['c2sFw'][qi]
-            s = znew[qi]
-            sn2d[sidx] = s
-
-            # > lower triangle
-            qi = np.tril(sctLUT['c2sFw'] + 1) > 0
-            sidx = sctLUT['c2sFw'][qi]
-            s = znew[qi]
-            sn2d[sidx] += s
-
-            ssn[ti, si, ...] = np.reshape(sn2d, (Cnt['NSANGLES'], Cnt['NSBINS']))
-            sssr[ti, ssrlut[si], ...] += ssn[ti, si, :, :]
+    # > interpolate the sinograms in parallel on separate cores
+    # > (the spline interpolation holds the GIL for long stretches);
+    # > forkserver rather than the default fork, as this may run from a
+    # > worker thread while the main thread is inside CUDA driver calls;
+    # > spawn on Windows, where forkserver is unavailable
+    mp_ctx = multiprocessing.get_context('forkserver' if sys.platform != 'win32' else 'spawn')
+    ncpu = os.cpu_count()
+    with ProcessPoolExecutor(ncpu, mp_context=mp_ctx, initializer=_init_intrp_worker,
+                             initargs=(x, y, luts['xnew'], luts['rows_ng'], luts['row_sel'],
+                                       luts['col_idx'], luts['sidx'],
+                                       (Cnt['NSANGLES'], Cnt['NSBINS']), dtype)) as ex:
+        for ti in range(Cnt['TOFBINN']):
+            for si, sn2d in enumerate(
+                    ex.map(_intrp_sino, sct_rolled, chunksize=max(1, snno // (4*ncpu)))):
+                ssn[ti, si, ...] = sn2d
+
+            # > accumulate into SSR sinograms in one vectorised scatter-add
+            np.add.at(sssr[ti], ssrlut, ssn[ti])
 
     return np.squeeze(ssn), np.squeeze(sssr)
     # -------------------------------------------------
@@ -472,8 +680,8 @@ def vsm(
         muim = muo + muh
         emim = em
 
-    muim = ndi.interpolation.zoom(muim, Cnt['SCTSCLMU'], order=3) # (0.499, 0.5, 0.5)
-    emim = ndi.interpolation.zoom(emim, Cnt['SCTSCLEM'], order=3) # (0.34, 0.33, 0.33)
+    muim = _zoom3d(muim, Cnt['SCTSCLMU']) # (0.499, 0.5, 0.5)
+    emim = _zoom3d(emim, Cnt['SCTSCLEM']) # (0.34, 0.33, 0.33)
 
     # -smooth the mu-map for mask creation.
     # the mask contains voxels for which attenuation ray LUT is found.
@@ -523,14 +731,18 @@ def vsm(
 
         log.debug('transaxial scatter interpolation...')
         start = time.time()
-        ssn, sssr = intrp_bsct(sct3d, Cnt, sctLUT, ssrlut)
-        stop = time.time()
-        log.debug('scatter interpolation done in {} sec.'.format(stop - start))
-
         if not scaling:
+            ssn, sssr = intrp_bsct(sct3d, Cnt, sctLUT, ssrlut)
+            log.debug('scatter interpolation done in {} sec.'.format(time.time() - start))
             out['ssrb'] = sssr
             out['sino'] = ssn
             return out
+
+        # > run the interpolation concurrently with the independent
+        # > attenuation/normalisation work below; pass a shallow copy of
+        # > the constants as Cnt['SPN'] is temporarily modified there
+        intrp_pool = ThreadPoolExecutor(1)
+        intrp_fut = intrp_pool.submit(intrp_bsct, sct3d, dict(Cnt), sctLUT, ssrlut)
     else:
         return out
     # -------------------------------------------------------------------
@@ -560,100 +772,111 @@ def vsm(
     '''
     # -------------------------------------------------------------------
 
-    # > get SSR for randoms from span-1 or span-11
-    rssr = np.zeros((Cnt['NSEG0'], Cnt['NSANGLES'], Cnt['NSBINS']), dtype=np.float32)
-    if scaling:
-        for i in range(snno):
-            rssr[ssrlut[i], :, :] += rsino[i, :, :]
-
-    # ATTENUATION FRACTIONS for scatter only regions, and NORMALISATION for all SCATTER
-    # <<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>>
-    currentspan = Cnt['SPN']
-    Cnt['SPN'] = 1
-    atto = cu.zeros((txLUT['Naw'], Cnt['NSN1']), dtype=np.float32)
-    petprj.fprj(atto, cu.asarray(mu_sctonly), txLUT, axLUT, np.array([-1], dtype=np.int32), Cnt, 1)
-    atto = mmraux.putgaps(atto, txLUT, Cnt)
-    # --------------------------------------------------------------
-    # > get norm components setting the geometry and axial to ones
-    # as they are accounted for differently
-    nrmcmp['geo'][:] = 1
-    nrmcmp['axe1'][:] = 1
-    # get sino with no gaps
-    nrmg = np.zeros((txLUT['Naw'], Cnt['NSN1']), dtype=np.float32)
-    mmr_auxe.norm(nrmg, nrmcmp, histo['buckets'], axLUT, txLUT['aw2ali'], Cnt)
-    nrm = mmraux.putgaps(nrmg, txLUT, Cnt)
-    # --------------------------------------------------------------
-
-    # > get attenuation + norm in (span-11) and SSR
-    attossr = np.zeros((Cnt['NSEG0'], Cnt['NSANGLES'], Cnt['NSBINS']), dtype=np.float32)
-    nrmsssr = np.zeros((Cnt['NSEG0'], Cnt['NSANGLES'], Cnt['NSBINS']), dtype=np.float32)
-
-    for i in range(Cnt['NSN1']):
-        si = axLUT['sn1_ssrb'][i]
-        attossr[si, :, :] += atto[i, :, :] / float(axLUT['sn1_ssrno'][si])
-        nrmsssr[si, :, :] += nrm[i, :, :] / float(axLUT['sn1_ssrno'][si])
-    if currentspan == 11:
-        Cnt['SPN'] = 11
-        nrmg = np.zeros((txLUT['Naw'], snno), dtype=np.float32)
+    try:
+        # > get SSR for randoms from span-1 or span-11
+        rssr = np.zeros((Cnt['NSEG0'], Cnt['NSANGLES'], Cnt['NSBINS']), dtype=np.float32)
+        if scaling:
+            np.add.at(rssr, ssrlut, rsino)
+
+        # ATTENUATION FRACTIONS for scatter only regions, and NORMALISATION for all SCATTER
+        # <<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>>
+        currentspan = Cnt['SPN']
+        Cnt['SPN'] = 1
+        atto = cu.zeros((txLUT['Naw'], Cnt['NSN1']), dtype=np.float32)
+        petprj.fprj(atto, cu.asarray(mu_sctonly), txLUT, axLUT,
+                    np.array([-1], dtype=np.int32), Cnt, 1)
+        atto = mmraux.putgaps(atto, txLUT, Cnt)
+        # --------------------------------------------------------------
+        # > get norm components setting the geometry and axial to ones
+        # as they are accounted for differently
+        nrmcmp['geo'][:] = 1
+        nrmcmp['axe1'][:] = 1
+        # get sino with no gaps
+        nrmg = np.zeros((txLUT['Naw'], Cnt['NSN1']), dtype=np.float32)
         mmr_auxe.norm(nrmg, nrmcmp, histo['buckets'], axLUT, txLUT['aw2ali'], Cnt)
         nrm = mmraux.putgaps(nrmg, txLUT, Cnt)
-    # --------------------------------------------------------------
-
-    # <<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>>
-
-    # get the mask for the object from uncorrected emission image
-    if emmsk and os.path.isfile(datain['em_nocrr']):
-        nim = nib.load(datain['em_nocrr'])
-        eim = nim.get_fdata(dtype=np.float32)
-        eim = eim[:, ::-1, ::-1]
-        eim = np.transpose(eim, (2, 1, 0))
-
-        em_sctonly = ndi.gaussian_filter(eim, fwhm2sig(.6, Cnt), mode='mirror')
-        msk = np.float32(em_sctonly > 0.07 * np.max(em_sctonly))
-        msk = ndi.gaussian_filter(msk, fwhm2sig(.6, Cnt), mode='mirror')
-        msk = np.float32(msk > 0.01)
-        msksn = mmrprj.frwd_prj(msk, txLUT, axLUT, Cnt)
-
-        mssr = mmraux.sino2ssr(msksn, axLUT, Cnt)
-        mssr = mssr > 0
-    else:
-        mssr = np.zeros((Cnt['NSEG0'], Cnt['NSANGLES'], Cnt['NSBINS']), dtype=bool)
-
-    # <<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>>
+        # --------------------------------------------------------------
+
+        # > get attenuation + norm in (span-11) and SSR
+        attossr = np.zeros((Cnt['NSEG0'], Cnt['NSANGLES'], Cnt['NSBINS']), dtype=np.float32)
+        nrmsssr = np.zeros((Cnt['NSEG0'], Cnt['NSANGLES'], Cnt['NSBINS']), dtype=np.float32)
+
+        inv_ssrno = (1 / axLUT['sn1_ssrno']).astype(np.float32)[:, None, None]
+        np.add.at(attossr, axLUT['sn1_ssrb'], atto)
+        attossr *= inv_ssrno
+        np.add.at(nrmsssr, axLUT['sn1_ssrb'], nrm)
+        nrmsssr *= inv_ssrno
+        if currentspan == 11:
+            Cnt['SPN'] = 11
+            nrmg = np.zeros((txLUT['Naw'], snno), dtype=np.float32)
+            mmr_auxe.norm(nrmg, nrmcmp, histo['buckets'], axLUT, txLUT['aw2ali'], Cnt)
+            nrm = mmraux.putgaps(nrmg, txLUT, Cnt)
+        # --------------------------------------------------------------
+
+        # <<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>>
+
+        # get the mask for the object from uncorrected emission image
+        if emmsk and os.path.isfile(datain['em_nocrr']):
+            nim = nib.load(datain['em_nocrr'])
+            eim = nim.get_fdata(dtype=np.float32)
+            eim = eim[:, ::-1, ::-1]
+            eim = np.transpose(eim, (2, 1, 0))
+
+            em_sctonly = ndi.gaussian_filter(eim, fwhm2sig(.6, Cnt), mode='mirror')
+            msk = np.float32(em_sctonly > 0.07 * np.max(em_sctonly))
+            msk = ndi.gaussian_filter(msk, fwhm2sig(.6, Cnt), mode='mirror')
+            msk = np.float32(msk > 0.01)
+            msksn = mmrprj.frwd_prj(msk, txLUT, axLUT, Cnt)
+
+            mssr = mmraux.sino2ssr(msksn, axLUT, Cnt)
+            mssr = mssr > 0
+        else:
+            mssr = np.zeros((Cnt['NSEG0'], Cnt['NSANGLES'], Cnt['NSBINS']), dtype=bool)
+
+        # <<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>><<+>>
+
+        # > collect the scatter interpolation overlapped with the work above
+        ssn, sssr = intrp_fut.result()
+        log.debug('scatter interpolation done in {} sec.'.format(time.time() - start))
+    finally:
+        # > never leak the background interpolation worker when the
+        # > projection/normalisation work above raises
+        intrp_pool.shutdown(wait=False)
 
     # ======= SCALING ========
     # > scale scatter using non-TOF SSRB sinograms
 
-    # > gap mask
-    rmsk = (txLUT['msino'] > 0).T
-    rmsk.shape = (1, Cnt['NSANGLES'], Cnt['NSBINS'])
-    rmsk = np.repeat(rmsk, Cnt['NSEG0'], axis=0)
+    # > gap mask, broadcast over the segments (no NSEG0-fold copy)
+    rmsk = (txLUT['msino'] > 0).T[None, :, :]
 
     # > include attenuating object into the mask (and the emission if selected)
-    amsksn = np.logical_and(attossr >= mask_threshlod, rmsk) * ~mssr
+    # > built up in place to avoid full-size boolean temporaries
+    amsksn = attossr >= mask_threshlod
+    amsksn &= rmsk
+    amsksn &= ~mssr
 
-    # > scaling factors for SSRB scatter
-    scl_ssr = np.zeros((Cnt['NSEG0']), dtype=np.float32)
+    # > region for scaling defined by the percentage of lowest
+    # > but usable/significant scatter
+    thrshld = prcnt_scl * sssr.max(axis=(1, 2), keepdims=True)
+    amsksn &= sssr > thrshld
 
-    for sni in range(Cnt['NSEG0']):
-        # > region for scaling defined by the percentage of lowest
-        # > but usable/significant scatter
-        thrshld = prcnt_scl * np.max(sssr[sni, :, :])
-        amsksn[sni, :, :] *= (sssr[sni, :, :] > thrshld)
-        amsk = amsksn[sni, :, :]
+    # > normalised estimated scatter and prompts-minus-randoms,
+    # > summed within the mask of each segment
+    mssn = np.where(amsksn, sssr * nrmsssr, 0).sum(axis=(1, 2))
+    vpsn = np.where(amsksn, histo['pssr'] - rssr, 0).sum(axis=(1, 2))
 
-        # > normalised estimated scatter
-        mssn = sssr[sni, :, :] * nrmsssr[sni, :, :]
-        vpsn = histo['pssr'][sni, amsk] - rssr[sni, amsk]
-        scl_ssr[sni] = np.sum(vpsn) / np.sum(mssn[amsk])
+    # > scaling factors for SSRB scatter, guarded against empty masks
+    scl_ssr = np.zeros(Cnt['NSEG0'], dtype=np.float32)
+    np.divide(vpsn, mssn, out=scl_ssr, where=mssn != 0)
 
-        # > scatter SSRB sinogram output
-        sssr[sni, :, :] *= nrmsssr[sni, :, :] * scl_ssr[sni]
+    # > scatter SSRB sinogram output
+    sssr *= nrmsssr * scl_ssr[:, None, None]
 
     # === scale scatter for the full-size sinogram ===
-    sss = np.zeros((snno, Cnt['NSANGLES'], Cnt['NSBINS']), dtype=np.float32)
-    for i in range(snno):
-        sss[i, :, :] = ssn[i, :, :] * scl_ssr[ssrlut[i]] * saxnrm[i] * nrm[i, :, :]
+    # > per-sinogram factors gathered once into a (snno, 1, 1) float32
+    # > array, keeping the broadcast multiply a single fused float32 pass
+    scale = (scl_ssr[ssrlut] * saxnrm).astype(np.float32)[:, None, None]
+    sss = ssn * scale * nrm
     '''
     # > debug
     si = 60
@@ -3,13 +3,19 @@
 Compile CUDA source code and setup Python 3 package 'nipet'
 for namespace 'niftypet'.
 """
+import hashlib
+import json
 import logging
+import mmap
+import os
 import re
+import subprocess
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from textwrap import dedent
 
-from setuptools import find_packages
 from setuptools_scm import get_version
 from skbuild import setup
 
@@ -28,45 +34,109 @@ tls.check_platform()
 # automatically detects if the CUDA header files are in agreement with Python constants.
 # =================================================================================================
 
+# > scanner of the '#define NAME value' constants kept in synch with Python,
+# > compiled once instead of per-constant in the check loops; bytes + re.ASCII
+# > keep it on the ASCII fast path of the regex engine with no UTF-8 decode
+_DEFINE_RE = re.compile(rb"#define[ \t]+(\w+)[ \t]+([-0-9.]+)", re.ASCII)
+
+
+# > CUDA headers kept in synch with the constants from resources.py
+_DEF_H = path_current / "niftypet" / "nipet" / "include" / "def.h"
+_SCT_H = path_current / "niftypet" / "nipet" / "sct" / "src" / "sct.h"
+
+_DEF_BLURB = ("//## start ##// constants definitions in synch with Python.   DON"
+              "T MODIFY MANUALLY HERE!\n" + "// IMAGE SIZE\n" + "// SZ_I* are image sizes\n" +
+              "// SZ_V* are voxel sizes\n")
+
+_SCT_BLURB = dedent("""\
+    //## start ##// constants definitions in synch with Python.   DO NOT MODIFY!\n
+    // SCATTER IMAGE SIZE AND PROPERTIES
+    // SS_* are used for the mu-map in scatter calculations
+    // SSE_* are used for the emission image in scatter calculations
+    // R_RING, R_2, IR_RING: ring radius, squared radius, inverse radius
+    // NCOS is the number of samples for scatter angular sampling
+    """)
+
+_CHECK_LOG_TMPL = dedent("""\
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    changed sct.h: {}
+    changed def.h: {}
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+    {}
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~""")
+
+
+def _cnt_stamp(Cnt, cnt_list):
+    """hash of the constants kept in synch with a header file."""
+    return hashlib.blake2b(repr([Cnt[s] for s in cnt_list]).encode()).hexdigest()
+
+
+def _resources_mtime():
+    """mtime of the user's resources.py, encoded into the header stamps."""
+    try:
+        return str(os.stat(os.path.join(cs.path_niftypet_local(), "resources.py")).st_mtime_ns)
+    except OSError:
+        return "?"
+
+
+def _stamp_key(fpth, Cnt, cnt_list):
+    """
+    stamp content for header `fpth`: resources.py mtime, the header's own
+    mtime and the hash of the synced constants - so an external edit to
+    either side (e.g. a git pull touching the header) invalidates the
+    fast paths.
+    """
+    return "{}\n{}\n{}".format(_resources_mtime(), fpth.stat().st_mtime_ns,
+                               _cnt_stamp(Cnt, cnt_list))
+
+
+def _sync_header(fpth, cnt_list, float_idx, blurb, Cnt):
+    """
+    keep the '#define' block of a CUDA header in synch with the Python constants.
+    `float_idx(i, s)` tells if constant `s` (at index `i` of `cnt_list`) is a
+    float, i.e. gets an 'f' suffix in the header.
+    Returns True if the header had to be rewritten.
+    """
+    rflg = False
+    # > fast path: skip reading and scanning the header when the stamp from
+    # > the last successful check matches the current constants
+    stamp = fpth.with_suffix(".h.stamp")
+    key = _stamp_key(fpth, Cnt, cnt_list)
+    if stamp.is_file() and stamp.read_text(errors="ignore") == key:
+        return rflg
+
+    data = fpth.read_bytes()
+    # get the region of keeping in synch with Python; scanned as raw bytes -
+    # int()/float() parse the byte values directly, no UTF-8 decode needed
+    i0 = data.index(b"//## start ##//")
+    i1 = data.index(b"//## end ##//")
+    defs = dict(_DEFINE_RE.findall(data[i0:i1]))
+    # if any constant differs then redefine them all in the header file
+    if any(
+            Cnt[s] != (float(defs[s.encode()]) if float_idx(i, s) else int(defs[s.encode()]))
+            for i, s in enumerate(cnt_list)):
+        strNew = blurb + "\n".join(f"#define {s} {Cnt[s]}{'f' if float_idx(i, s) else ''}"
+                                   for i, s in enumerate(cnt_list)) + "\n"
+
+        # > write to a sidecar and rename atomically, so an interrupted run
+        # > cannot leave a truncated header behind for the CUDA compilation
+        tmp = fpth.with_suffix(fpth.suffix + ".tmp")
+        tmp.write_bytes(data[:i0] + strNew.encode() + data[i1:])
+        os.replace(tmp, fpth)
+        rflg = True
+        # > the rewrite changed the header's mtime encoded in the stamp
+        key = _stamp_key(fpth, Cnt, cnt_list)
+
+    stamp.write_text(key)
+    return rflg
+
 
 def chck_vox_h(Cnt):
     """check if voxel size in Cnt and adjust the CUDA header files accordingly."""
-    rflg = False
-    fpth = path_current / "niftypet" / "nipet" / "include" / "def.h"
-    def_h = fpth.read_text()
-    # get the region of keeping in synch with Python
-    i0 = def_h.find("//## start ##//")
-    i1 = def_h.find("//## end ##//")
-    defh = def_h[i0:i1]
     # list of constants which will be kept in synch from Python
     cnt_list = [
         "SZ_IMX", "SZ_IMY", "SZ_IMZ", "TFOV2", "SZ_VOXY", "SZ_VOXZ", "SZ_VOXZi", "RSZ_PSF_KRNL"]
-    flg = False
-    for s in cnt_list:
-        m = re.search("(?<=#define " + s + r")\s*\d*\.*\d*", defh)
-        if s[3] == "V":
-            # print(s, float(m.group(0)), Cnt[s])
-            if Cnt[s] != float(m.group(0)):
-                flg = True
-                break
-        else:
-            # print(s, int(m.group(0)), Cnt[s])
-            if Cnt[s] != int(m.group(0)):
-                flg = True
-                break
-    # if flag is set then redefine the constants in the sct.h file
-    if flg:
-        strNew = ("//## start ##// constants definitions in synch with Python.   DON"
-                  "T MODIFY MANUALLY HERE!\n" + "// IMAGE SIZE\n" + "// SZ_I* are image sizes\n" +
-                  "// SZ_V* are voxel sizes\n")
-        strDef = "#define "
-        for s in cnt_list:
-            strNew += strDef + s + " " + str(Cnt[s]) + (s[3] == "V") * "f" + "\n"
-
-        fpth.write_text(def_h[:i0] + strNew + def_h[i1:])
-        rflg = True
-
-    return rflg
+    return _sync_header(_DEF_H, cnt_list, lambda i, s: s[3] == "V", _DEF_BLURB, Cnt)
 
 
 def chck_sct_h(Cnt):
@@ -74,63 +144,45 @@ def chck_sct_h(Cnt):
     check if voxel size for scatter correction changed and adjust
     the CUDA header files accordingly.
     """
-    rflg = False
-    fpth = path_current / "niftypet" / "nipet" / "sct" / "src" / "sct.h"
-    # pthcmpl = path.dirname(resource_filename(__name__, ''))
-    sct_h = fpth.read_text()
-    # get the region of keeping in synch with Python
-    i0 = sct_h.find("//## start ##//")
-    i1 = sct_h.find("//## end ##//")
-    scth = sct_h[i0:i1]
+    # NB: for package-data paths use importlib.resources.files("niftypet.nipet")
+    # rather than the slow-to-import pkg_resources API
     # list of constants which will be kept in sych from Python
     cnt_list = [
         "SS_IMX", "SS_IMY", "SS_IMZ", "SSE_IMX", "SSE_IMY", "SSE_IMZ", "NCOS", "SS_VXY", "SS_VXZ",
         "IS_VXZ", "SSE_VXY", "SSE_VXZ", "R_RING", "R_2", "IR_RING", "SRFCRS"]
-    flg = False
-    for i, s in enumerate(cnt_list):
-        m = re.search("(?<=#define " + s + r")\s*\d*\.*\d*", scth)
-        # if s[-3]=='V':
-        if i < 7:
-            # print(s, int(m.group(0)), Cnt[s])
-            if Cnt[s] != int(m.group(0)):
-                flg = True
-                break
-        else:
-            # print(s, float(m.group(0)), Cnt[s])
-            if Cnt[s] != float(m.group(0)):
-                flg = True
-                break
-
-    # if flag is set then redefine the constants in the sct.h file
-    if flg:
-        strNew = dedent("""\
-            //## start ##// constants definitions in synch with Python.   DO NOT MODIFY!\n
-            // SCATTER IMAGE SIZE AND PROPERTIES
-            // SS_* are used for the mu-map in scatter calculations
-            // SSE_* are used for the emission image in scatter calculations
-            // R_RING, R_2, IR_RING: ring radius, squared radius, inverse radius
-            // NCOS is the number of samples for scatter angular sampling
-            """)
-
-        strDef = "#define "
-        for i, s in enumerate(cnt_list):
-            strNew += strDef + s + " " + str(Cnt[s]) + (i > 6) * "f" + "\n"
-
-        fpth.write_text(sct_h[:i0] + strNew + sct_h[i1:])
-        # sys.path.append(pthcmpl)
-        rflg = True
-
-    return rflg
+    return _sync_header(_SCT_H, cnt_list, lambda i, s: i >= 7, _SCT_BLURB, Cnt)
 
 
 def check_constants():
     """get the constants for the mMR from the resources file before
     getting the path to the local resources.py (on Linux machines it is in ~/.niftypet)"""
+    # > fast path: when both header stamps already encode the current mtimes
+    # > of resources.py and of the headers themselves, neither side can have
+    # > changed since the last check, so loading the constants (importing
+    # > resources.py) can be skipped altogether
+    mtime = _resources_mtime()
+
+    def _stamp_fresh(fpth):
+        stamp = fpth.with_suffix(".h.stamp")
+        try:
+            head = "{}\n{}\n".format(mtime, fpth.stat().st_mtime_ns)
+            return stamp.read_text(errors="ignore").startswith(head)
+        except OSError:
+            return False
+
+    if mtime != "?" and all(_stamp_fresh(f) for f in (_SCT_H, _DEF_H)):
+        log.info("CUDA headers in synch with resources.py (unchanged)")
+        return
+
     resources = cs.get_resources()
     Cnt = resources.get_mmr_constants()
 
-    sct_compile = chck_sct_h(Cnt)
-    def_compile = chck_vox_h(Cnt)
+    # > the two checks touch distinct files, so overlap their I/O
+    with ThreadPoolExecutor(2) as ex:
+        fut_sct = ex.submit(chck_sct_h, Cnt)
+        fut_def = ex.submit(chck_vox_h, Cnt)
+        sct_compile = fut_sct.result()
+        def_compile = fut_def.result()
     # sct_compile = False
     # def_compile = False
 
@@ -139,38 +191,94 @@ def check_constants():
     else:
         txt = "- - . - -"
 
-    log.info(
-        dedent("""\
-            ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-            changed sct.h: {}
-            changed def.h: {}
-            ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-            {}
-            ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~""").format(
-            sct_compile, def_compile, txt))
+    log.info(_CHECK_LOG_TMPL.format(sct_compile, def_compile, txt))
 
 
-cs.resources_setup(gpu=False) # install resources.py
+def _dev_setup_cached(ttl=24 * 3600):
+    """
+    GPU architectures from cs.dev_setup(), memoized across setup.py runs.
+    The result is keyed on the 'nvidia-smi -L' device inventory plus the
+    mtime of resources.py and kept in ~/.niftypet for `ttl` seconds, so warm
+    rebuilds with an unchanged GPU set-up skip probing the CUDA driver.
+    A freshly (re)installed resources.py misses the cache, ensuring
+    dev_setup() writes its GPU device section into the new file.
+    """
+    try:
+        key = hashlib.sha1(subprocess.check_output(["nvidia-smi", "-L"])).hexdigest()
+    except (OSError, subprocess.CalledProcessError):
+        return cs.dev_setup()
+
+    cache = Path(cs.path_niftypet_local()) / "gpuarch.json"
+    try:
+        cached = json.loads(cache.read_text())
+        if (cached["key"] == key and cached["rc_mtime"] == _resources_mtime()
+                and time.time() - cached["ts"] < ttl):
+            return cached["arches"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    arches = cs.dev_setup()
+    try:
+        cache.write_text(
+            json.dumps({
+                "key": key, "rc_mtime": _resources_mtime(), "ts": time.time(),
+                "arches": list(arches)}))
+    except OSError as exc:
+        log.warning("could not save the GPU architecture cache:\n%s", exc)
+    return arches
+
+
+def _resources_current():
+    """
+    True when the user's resources.py is already installed and at least as
+    recent as the template shipped with ninst, so re-installing it on every
+    setup.py run can be skipped.
+    """
+    rsp = Path(cs.path_niftypet_local()) / "resources.py"
+    tmpl = Path(cs.__file__).parent / "raw" / "resources.py"
+    try:
+        return tmpl.is_file() and rsp.stat().st_mtime >= tmpl.stat().st_mtime
+    except OSError:
+        return False
+
+
+if not _resources_current():
+    cs.resources_setup(gpu=False) # install resources.py
 
 # check and update the constants in C headers according to resources.py
 check_constants()
 try:
-    nvcc_arches = cs.dev_setup() # update resources.py with a supported GPU device
+    nvcc_arches = _dev_setup_cached() # update resources.py with a supported GPU device
 except Exception as exc:
     nvcc_arches = []
     log.error("could not set up CUDA:\n%s", exc)
 
 build_ver = ".".join(__version__.split('.')[:3]).split(".dev")[0]
 cmake_args = [f"-DNIPET_BUILD_VERSION={build_ver}", f"-DPython3_ROOT_DIR={sys.prefix}"]
-try:
-    if nvcc_arches:
-        cmake_args.append("-DCMAKE_CUDA_ARCHITECTURES=" + ";".join(sorted(nvcc_arches)))
-except Exception as exc:
-    if "sdist" not in sys.argv or any(i in sys.argv for i in ["build", "bdist", "wheel"]):
-        log.warning("Import or CUDA device detection error:\n%s", exc)
+# CUDA architectures: an explicit CUDAARCHS environment override wins, then
+# any devices detected above; otherwise leave it to CMake, which
+# auto-detects the build host's GPUs natively (>= 3.24, cf. CMakeLists.txt)
+# so builds also work without a GPU visible at configure time.
+if "CUDAARCHS" in os.environ:
+    cmake_args.append("-DCMAKE_CUDA_ARCHITECTURES=" + os.environ["CUDAARCHS"])
+elif nvcc_arches:
+    cmake_args.append("-DCMAKE_CUDA_ARCHITECTURES=" + ";".join(sorted(nvcc_arches)))
+_PBE_RE = re.compile(rb"^//.*$\n^[^#].*pip-build-env.*$", re.M)
 for i in (Path(__file__).resolve().parent / "_skbuild").rglob("CMakeCache.txt"):
-    i.write_text(re.sub("^//.*$\n^[^#].*pip-build-env.*$", "", i.read_text(), flags=re.M))
-setup(use_scm_version=True, packages=find_packages(exclude=["examples", "tests"]),
+    if i.stat().st_size == 0:
+        continue
+    # memory-mapped scan so unaffected caches are neither decoded nor rewritten
+    with i.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if mm.find(b"pip-build-env") < 0:
+            continue
+        cache = mm[:]
+    i.write_bytes(_PBE_RE.sub(b"", cache))
+# > known package layout: spelling it out avoids find_packages() walking the
+# > whole source tree (incl. _skbuild) on every configure
+nipet_packages = [
+    "niftypet", "niftypet.nipet", "niftypet.nipet.img", "niftypet.nipet.lm",
+    "niftypet.nipet.prj", "niftypet.nipet.sct"]
+setup(use_scm_version=True, packages=nipet_packages,
       package_data={"niftypet": ["nipet/auxdata/*"]}, cmake_source_dir="niftypet",
       cmake_languages=("C", "CXX", "CUDA"), cmake_minimum_required_version="3.18",
       cmake_args=cmake_args)